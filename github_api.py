@@ -0,0 +1,520 @@
+"""GitHub REST API client used by the rosdep updater scripts.
+
+Wraps the handful of endpoints needed to scan the haru-project
+organization for catkin packages: repository listing, directory
+contents, file contents and git trees.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # pragma: no cover - orjson is optional
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = 'https://api.github.com'
+
+
+class RateLimitError(Exception):
+    """Raised when the GitHub API rate limit has been exhausted."""
+
+
+class _ETagCache:
+    """Persistent ``{url: (etag, body, next_url)}`` store for conditional
+    requests.
+
+    GitHub returns an ETag on every response and answers a matching
+    If-None-Match with a bodyless 304 that does not count against the
+    rate limit, so re-runs over an unchanged organization cost almost
+    nothing.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'url TEXT PRIMARY KEY, etag TEXT, body TEXT, next_url TEXT)')
+            self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, body, next_url FROM responses WHERE url = ?',
+                (url,)).fetchone()
+        if row is None:
+            return None, None, None
+        return row[0], _json_loads(row[1]), row[2]
+
+    def set(self, url, etag, body, next_url=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                (url, etag, json.dumps(body), next_url))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class GitHubAPI:
+    """Minimal GitHub REST API (v3) client.
+
+    All requests go through a single pooled ``requests.Session`` so the
+    TLS handshake to api.github.com is paid once instead of once per
+    call. Use it as a context manager to make sure the pool is released:
+
+        with create_github_client() as github_client:
+            repos = github_client.get_organization_repositories()
+    """
+
+    def __init__(self, token=None, cache_path='.github_cache'):
+        self.token = token or os.environ.get('GITHUB_TOKEN')
+        self.public_headers = {
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        }
+        self.headers = dict(self.public_headers)
+        if self.token:
+            self.headers['Authorization'] = f'Bearer {self.token}'
+        self._session = requests.Session()
+        self._session.headers.update(self.public_headers)
+        retry = Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[502, 503, 504])
+        self._session.mount('https://', HTTPAdapter(pool_connections=4,
+                                                    pool_maxsize=32,
+                                                    max_retries=retry))
+        self._default_branch_cache = {}
+        self._repo_cache = {}
+        self._exists_cache = {}
+        self._cache = _ETagCache(cache_path) if cache_path else None
+        self._rl_remaining = 9999
+        self._rl_reset = 0
+
+    def close(self):
+        self._session.close()
+        if self._cache is not None:
+            self._cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _note_rate_limit(self, response):
+        """Track the quota headers and pace requests near exhaustion.
+
+        When fewer than 50 calls remain and the window resets soon,
+        spread the remaining calls evenly over the time left so a long
+        scan finishes instead of crashing on a 403 halfway through.
+        """
+        try:
+            self._rl_remaining = int(
+                response.headers.get('X-RateLimit-Remaining',
+                                     self._rl_remaining))
+            self._rl_reset = int(
+                response.headers.get('X-RateLimit-Reset', self._rl_reset))
+        except ValueError:
+            return
+        seconds_left = self._rl_reset - time.time()
+        if self._rl_remaining < 50 and 0 < seconds_left < 120:
+            delay = seconds_left / max(self._rl_remaining, 1)
+            logger.warning('Rate limit nearly exhausted (%d calls left), '
+                           'throttling %.1fs per call',
+                           self._rl_remaining, delay)
+            time.sleep(delay)
+
+    def _throttled_send(self, method, url, **kwargs):
+        """Send a request, honoring Retry-After on secondary limits."""
+        response = None
+        for attempt in range(3):
+            response = self._session.request(method, url, timeout=30,
+                                             **kwargs)
+            self._note_rate_limit(response)
+            retry_after = response.headers.get('Retry-After')
+            if response.status_code in (403, 429) and retry_after:
+                delay = min(60, max(int(retry_after), 2 ** attempt))
+                logger.warning('Secondary rate limit hit, retrying in %ds',
+                               delay)
+                time.sleep(delay)
+                continue
+            break
+        return response
+
+    def _request(self, url, params=None, headers=None):
+        """Perform a GET request and raise on API errors."""
+        response = self._throttled_send('GET', url,
+                                        headers=headers or self.headers,
+                                        params=params)
+        if (response.status_code == 403
+                and response.headers.get('X-RateLimit-Remaining') == '0'):
+            raise RateLimitError('GitHub API rate limit exceeded')
+        response.raise_for_status()
+        return response
+
+    def _cached_json(self, url, params=None, with_next=False):
+        """GET a JSON endpoint through the conditional-request cache.
+
+        Sends If-None-Match with the stored ETag and serves the cached
+        body on 304, which GitHub does not count against the rate limit.
+        """
+        if params:
+            prepared = requests.models.PreparedRequest()
+            prepared.prepare_url(url, params)
+            url = prepared.url
+        etag, cached_body, cached_next = (None, None, None)
+        headers = self.headers
+        if self._cache is not None:
+            etag, cached_body, cached_next = self._cache.get(url)
+            if etag:
+                headers = dict(self.headers)
+                headers['If-None-Match'] = etag
+        response = self._throttled_send('GET', url, headers=headers)
+        if response.status_code == 304:
+            logger.debug('Cache hit (304) for %s', url)
+            return (cached_body, cached_next) if with_next else cached_body
+        if (response.status_code == 403
+                and response.headers.get('X-RateLimit-Remaining') == '0'):
+            raise RateLimitError('GitHub API rate limit exceeded')
+        response.raise_for_status()
+        body = _json_loads(response.content)
+        next_url = response.links.get('next', {}).get('url')
+        if self._cache is not None and response.headers.get('ETag'):
+            self._cache.set(url, response.headers['ETag'], body, next_url)
+        return (body, next_url) if with_next else body
+
+    def graphql(self, query, variables=None):
+        """Run a GraphQL query, used to batch several lookups per POST.
+
+        Requires an authenticated client; the GraphQL endpoint rejects
+        anonymous requests.
+        """
+        if not self.token:
+            raise RuntimeError('The GitHub GraphQL API requires a token')
+        response = self._throttled_send('POST', f'{GITHUB_API_URL}/graphql',
+                                        json={'query': query,
+                                              'variables': variables or {}},
+                                        headers=self.headers)
+        if (response.status_code == 403
+                and response.headers.get('X-RateLimit-Remaining') == '0'):
+            raise RateLimitError('GitHub GraphQL API rate limit exceeded')
+        response.raise_for_status()
+        payload = _json_loads(response.content)
+        if payload.get('errors'):
+            logger.warning('GraphQL query errors: %s', payload['errors'])
+        return payload.get('data') or {}
+
+    def iter_organization_repositories(self, org='haru-project',
+                                       per_page=100, sort=None):
+        """Yield the repositories of the organization page by page.
+
+        Being a generator, consumers can start scanning the repos of
+        page 1 while page 2 is still downloading. No server-side sort is
+        requested by default — the scan does not depend on ordering and
+        unsorted listings are served faster.
+        """
+        count = 0
+        params = {
+            'per_page': per_page,
+            'type': 'all',
+        }
+        if sort:
+            params['sort'] = sort
+        next_url = f'{GITHUB_API_URL}/orgs/{org}/repos'
+        while next_url:
+            page_repos, next_url = self._cached_json(next_url, params=params,
+                                                     with_next=True)
+            params = None  # the Link URL carries the query string
+            # The listing already carries the repo metadata, so later
+            # find_package_xml_files calls need no per-repo lookup.
+            for repo_data in page_repos:
+                self._default_branch_cache[(org, repo_data['name'])] = \
+                    repo_data.get('default_branch') or 'master'
+                count += 1
+                yield repo_data
+        logger.info('Found %d repositories in %s', count, org)
+
+    def get_organization_repositories(self, org='haru-project', per_page=100):
+        """Return all repositories of the organization."""
+        return list(self.iter_organization_repositories(org, per_page))
+
+    def get_specific_repository(self, owner, repo):
+        """Return the metadata of a single repository (memoized)."""
+        key = (owner, repo)
+        repo_data = self._repo_cache.get(key)
+        if repo_data is None:
+            repo_data = self._cached_json(
+                f'{GITHUB_API_URL}/repos/{owner}/{repo}')
+            self._repo_cache[key] = repo_data
+        return repo_data
+
+    def get_repository_contents(self, owner, repo, path='', ref=None):
+        """List the contents of a directory in a repository."""
+        params = {'ref': ref} if ref else None
+        return self._cached_json(
+            f'{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{path}',
+            params=params)
+
+    def get_file_content(self, owner, repo, path, ref=None):
+        """Return the decoded content of a file in a repository.
+
+        Fetches raw.githubusercontent.com when possible: the response is
+        the file itself (no JSON envelope, no base64 step) and it does
+        not consume REST API quota. Falls back to the contents endpoint
+        with the raw media type.
+        """
+        if ref is None:
+            ref = self.get_default_branch(owner, repo)
+        raw_url = (f'https://raw.githubusercontent.com/'
+                   f'{owner}/{repo}/{ref}/{path}')
+        etag, cached_body = (None, None)
+        headers = None
+        if self._cache is not None:
+            etag, cached_body, _ = self._cache.get(raw_url)
+            if etag:
+                headers = {'If-None-Match': etag}
+        response = self._session.get(raw_url, timeout=30, headers=headers)
+        if response.status_code == 304:
+            logger.debug('Cache hit (304) for %s', raw_url)
+            return cached_body
+        if response.status_code == 200:
+            if self._cache is not None and response.headers.get('ETag'):
+                self._cache.set(raw_url, response.headers['ETag'],
+                                response.text)
+            return response.text
+        logger.debug('Raw fetch of %s returned %d, falling back to the API',
+                     raw_url, response.status_code)
+        headers = dict(self.headers)
+        headers['Accept'] = 'application/vnd.github.raw+json'
+        response = self._request(
+            f'{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{path}',
+            params={'ref': ref}, headers=headers)
+        return response.text
+
+    def file_exists(self, owner, repo, path, ref=None):
+        """Return whether a file exists in a repository.
+
+        One HEAD against raw.githubusercontent.com instead of listing
+        the whole directory through the contents API: the response has
+        no body at all and does not touch the REST quota. Private
+        repositories answer 404 on raw unless the token is sent, so the
+        request carries it, and anything but a clean 200/404 is settled
+        through the contents API. Results are memoized per
+        (repo, ref, path) for the run.
+        """
+        if ref is None:
+            ref = self.get_default_branch(owner, repo)
+        key = (owner, repo, ref, path)
+        exists = self._exists_cache.get(key)
+        if exists is None:
+            raw_url = (f'https://raw.githubusercontent.com/'
+                       f'{owner}/{repo}/{ref}/{path}')
+            headers = {'Authorization': f'Bearer {self.token}'} \
+                if self.token else None
+            response = self._session.head(raw_url, timeout=30,
+                                          allow_redirects=True,
+                                          headers=headers)
+            if response.status_code == 200:
+                exists = True
+            elif response.status_code == 404 and self.token:
+                exists = False
+            else:
+                # Unauthenticated 404s are ambiguous (private repos
+                # look missing); let the contents API decide.
+                response = self._throttled_send(
+                    'GET',
+                    f'{GITHUB_API_URL}/repos/{owner}/{repo}'
+                    f'/contents/{path}',
+                    headers=self.headers, params={'ref': ref})
+                exists = response.status_code == 200
+            self._exists_cache[key] = exists
+        return exists
+
+    def get_repository_tree(self, owner, repo, ref):
+        """Return the raw recursive git tree of a repository."""
+        return self._cached_json(
+            f'{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{ref}',
+            params={'recursive': '1'})
+
+    def get_repository_tree_paths(self, owner, repo, ref):
+        """Return the paths of all files in a repository in one call."""
+        tree_data = self.get_repository_tree(owner, repo, ref)
+        if tree_data.get('truncated'):
+            logger.warning('Tree listing for %s/%s was truncated',
+                           owner, repo)
+        return [entry['path'] for entry in tree_data.get('tree', [])
+                if entry.get('type') == 'blob']
+
+    def get_file_contents_batch(self, owner, repo, paths, ref=None,
+                                shas=None):
+        """Fetch several files of one repository in a single GraphQL call.
+
+        Returns ``{path: text}``; paths that do not exist map to None.
+        Each file becomes an aliased Blob field, so a repo with K files
+        costs one POST instead of K GETs. Unauthenticated clients fall
+        back to per-file fetches (GraphQL requires a token).
+
+        ``shas`` may map paths to their blob SHAs (as reported by the
+        tree listing). Blobs are content-addressed, so a body cached
+        under its SHA is valid forever: files whose SHA has not moved
+        since the last run are served from the on-disk cache without
+        any network traffic at all.
+        """
+        if not paths:
+            return {}
+        contents = {}
+        if shas and self._cache is not None:
+            misses = []
+            for path in paths:
+                sha = shas.get(path)
+                _, body, _ = self._cache.get(f'blob:{sha}') if sha \
+                    else (None, None, None)
+                if body is not None:
+                    contents[path] = body
+                else:
+                    misses.append(path)
+            if not misses:
+                return contents
+            logger.debug('%d of %d blobs of %s/%s served from cache',
+                         len(contents), len(paths), owner, repo)
+            paths = misses
+        if not self.token:
+            # Map failures to None like the GraphQL path does for
+            # missing blobs, so one flaky file cannot abort the scan.
+            fetched = {}
+            for path in paths:
+                try:
+                    fetched[path] = self.get_file_content(owner, repo,
+                                                          path, ref)
+                except RateLimitError:
+                    raise
+                except requests.RequestException as exc:
+                    logger.warning('Could not fetch %s/%s/%s: %s',
+                                   owner, repo, path, exc)
+                    fetched[path] = None
+            self._store_blobs(fetched, shas)
+            contents.update(fetched)
+            return contents
+        if ref is None:
+            ref = self.get_default_branch(owner, repo)
+        fetched = {}
+        chunk_size = 100
+        for start in range(0, len(paths), chunk_size):
+            chunk = paths[start:start + chunk_size]
+            fields = ' '.join(
+                f'f{i}: object(expression: {json.dumps(f"{ref}:{path}")}) '
+                '{ ... on Blob { text } }'
+                for i, path in enumerate(chunk))
+            query = ('query($owner: String!, $name: String!) { '
+                     'repository(owner: $owner, name: $name) '
+                     '{ %s } }' % fields)
+            data = self.graphql(query, {'owner': owner, 'name': repo})
+            repository = data.get('repository') or {}
+            for i, path in enumerate(chunk):
+                blob = repository.get(f'f{i}') or {}
+                fetched[path] = blob.get('text')
+        self._store_blobs(fetched, shas)
+        contents.update(fetched)
+        return contents
+
+    def _store_blobs(self, fetched, shas):
+        """Persist freshly fetched bodies under their blob SHAs."""
+        if not shas or self._cache is None:
+            return
+        for path, body in fetched.items():
+            sha = shas.get(path)
+            if sha and body is not None:
+                self._cache.set(f'blob:{sha}', None, body)
+
+    def get_default_branch(self, owner, repo):
+        """Return the default branch of a repository (cached per repo)."""
+        key = (owner, repo)
+        if key not in self._default_branch_cache:
+            repo_data = self.get_specific_repository(owner, repo)
+            self._default_branch_cache[key] = repo_data.get(
+                'default_branch', 'master')
+        return self._default_branch_cache[key]
+
+    def find_package_xml_files(self, owner, repo, path='', ref=None):
+        """Find all package.xml files in a repository.
+
+        Uses a single recursive git tree listing instead of walking the
+        contents API directory by directory, so discovery costs one API
+        call per repository regardless of its layout.
+        """
+        if ref is None:
+            ref = self.get_default_branch(owner, repo)
+        try:
+            tree_data = self.get_repository_tree(owner, repo, ref)
+        except requests.HTTPError as exc:
+            logger.warning('Could not list tree of %s/%s: %s',
+                           owner, repo, exc)
+            return []
+        if tree_data.get('truncated'):
+            # Repo too large for one tree listing; fall back to walking
+            # the contents API breadth-first.
+            logger.warning('Tree of %s/%s truncated, '
+                           'walking the contents API instead', owner, repo)
+            return self._find_package_xml_files_contents(owner, repo, path,
+                                                         ref)
+        package_xml_files = [entry['path']
+                             for entry in tree_data.get('tree', [])
+                             if entry.get('type') == 'blob'
+                             and (entry['path'] == 'package.xml'
+                                  or entry['path'].endswith('/package.xml'))]
+        if path:
+            prefix = path.rstrip('/') + '/'
+            package_xml_files = [p for p in package_xml_files
+                                 if p.startswith(prefix)]
+        return package_xml_files
+
+    def _find_package_xml_files_contents(self, owner, repo, path, ref):
+        """Iterative breadth-first walk over the contents API.
+
+        Only used when the tree listing is truncated. An explicit deque
+        instead of recursion: no RecursionError on deep monorepos and
+        each popped directory is an independent unit of work.
+        """
+        package_xml_files = []
+        todo = deque([path])
+        while todo:
+            current = todo.popleft()
+            try:
+                items = self.get_repository_contents(owner, repo, current,
+                                                     ref)
+            except requests.HTTPError as exc:
+                logger.warning('Could not list %s/%s/%s: %s',
+                               owner, repo, current, exc)
+                continue
+            if isinstance(items, dict):
+                items = [items]
+            for item in items:
+                if item['type'] == 'file' and item['name'] == 'package.xml':
+                    package_xml_files.append(item['path'])
+                elif item['type'] == 'dir':
+                    todo.append(item['path'])
+        return package_xml_files
+
+
+def create_github_client():
+    """Create a GitHubAPI client from the GITHUB_TOKEN environment."""
+    token = os.environ.get('GITHUB_TOKEN')
+    if not token:
+        logger.warning('GITHUB_TOKEN not set, using unauthenticated requests '
+                       '(60 requests/hour limit)')
+    return GitHubAPI(token)
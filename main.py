@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Update rosdep.yaml with the catkin packages of the haru-project org.
+
+Meant to be run periodically (cron / CI). Requires a GITHUB_TOKEN
+environment variable with read access to the organization. Set
+FORCE_UPDATE=1 to rewrite entries that already exist.
+"""
+
+import json
+import logging
+import os
+import sys
+
+from github_api import RateLimitError, create_github_client
+from package_analyzer import PackageAnalyzer
+from rosdep_updater import update_rosdep_with_packages
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = '.rosdep_state.json'
+
+
+def load_scan_state():
+    """Return the {repo_name: pushed_at} map of the previous run."""
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_scan_state(repositories):
+    """Remember the pushed_at of every repo seen in this run."""
+    state = {repository['name']: repository.get('pushed_at')
+             for repository in repositories}
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def main():
+    logging.basicConfig(
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    force_update = os.environ.get('FORCE_UPDATE', '').lower() in (
+        '1', 'true', 'yes')
+    try:
+        with create_github_client() as github_client:
+            analyzer = PackageAnalyzer(github_client)
+            repositories = github_client.get_organization_repositories(
+                'haru-project')
+            if force_update:
+                fresh = repositories
+            else:
+                # Repos whose pushed_at has not moved since the last run
+                # cannot contain new packages: skip them entirely.
+                state = load_scan_state()
+                fresh = [repository for repository in repositories
+                         if state.get(repository['name'])
+                         != repository.get('pushed_at')]
+                logger.info('Scanning %d of %d repositories '
+                            '(rest unchanged since last run)',
+                            len(fresh), len(repositories))
+            packages = analyzer.analyze_organization_repositories(
+                'haru-project', repositories=fresh)
+    except RateLimitError as exc:
+        logger.error('Aborted: %s', exc)
+        return 1
+    unique_packages = analyzer.get_unique_packages(packages)
+    logger.info('%d unique packages found', len(unique_packages))
+    result = update_rosdep_with_packages(unique_packages,
+                                         force_update=force_update)
+    if not result['success']:
+        logger.error('rosdep.yaml update failed')
+        return 1
+    save_scan_state(repositories)
+    logger.info('Done: %d packages added, %d total',
+                result['added_count'], result['total_packages'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""Analysis of catkin packages hosted in the haru-project organization.
+
+Walks repositories looking for package.xml files, extracts the package
+names and turns them into :class:`ROSPackage` objects that the rosdep
+updater can add to rosdep.yaml.
+"""
+
+import io
+import logging
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml is optional
+    etree = None
+
+from github_api import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+def _extract_name(xml_bytes):
+    """Return the first top-level <name> of a package manifest, or None.
+
+    Streams the document and stops at the first hit instead of building
+    the whole tree: package.xml nests many more <name> tags (maintainer,
+    author, dependencies) that never need materializing.
+    """
+    buf = io.BytesIO(xml_bytes)
+    if etree is not None:
+        try:
+            for _, element in etree.iterparse(buf, events=('end',),
+                                              tag='name', recover=True):
+                parent = element.getparent()
+                if parent is not None and parent.getparent() is None:
+                    text = (element.text or '').strip()
+                    element.clear(keep_tail=True)
+                    return text or None
+        except etree.XMLSyntaxError:
+            return None
+        return None
+    depth = 0
+    try:
+        for event, element in ET.iterparse(buf, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1 and element.tag == 'name':
+                    return (element.text or '').strip() or None
+    except ET.ParseError:
+        return None
+    return None
+
+
+@lru_cache(maxsize=None)
+def _to_debian(name):
+    """Debian package names use dashes instead of underscores.
+
+    Cached at module level: the same package names recur across
+    repositories and duplicate-detection passes.
+    """
+    return name.replace('_', '-')
+
+
+class ROSPackage:
+    """A catkin package found in one of the organization repositories."""
+
+    def __init__(self, name, repository):
+        self.name = sys.intern(name)
+        self.repository = repository
+        debian = _to_debian(name)
+        self.debian_name = debian
+        # The distro mapping is fixed, so build the whole nested entry
+        # once here; consumers reference it instead of re-assembling
+        # dicts per call (plain concatenation: this is the hottest
+        # constant-format spot in a scan).
+        self._rosdep_entries = {
+            'xenial': ['ros-kinetic-' + debian],
+            'bionic': ['ros-melodic-' + debian],
+            'focal': ['ros-noetic-' + debian],
+        }
+        self.rosdep_entry = {'ubuntu': self._rosdep_entries}
+        # All fields are immutable after construction, so the repr can
+        # be rendered once — it is hit for every package the analyzer
+        # logs.
+        self._repr = (f"ROSPackage(name='{name}', "
+                      f"repo='{repository}', debian='{debian}')")
+
+    def get_rosdep_entries(self):
+        """Return the per-distro debian package names for rosdep.yaml."""
+        return self._rosdep_entries
+
+    def __str__(self):
+        return self._repr
+
+    __repr__ = __str__
+
+
+class PackageAnalyzer:
+    """Finds ROS packages in GitHub repositories."""
+
+    def __init__(self, github_client):
+        self.github_client = github_client
+
+    def extract_package_name_from_xml(self, xml_content):
+        """Extract the package name from the content of a package.xml."""
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+        package_name = _extract_name(xml_content)
+        if not package_name:
+            logger.warning('package.xml has no readable <name> element')
+            return None
+        logger.debug('Extracted package name: %s', package_name)
+        return package_name
+
+    def validate_ros_package_structure(self, owner, repo, package_dir,
+                                       tree_paths=None):
+        """Check that the package directory looks like a catkin package.
+
+        A catkin package contains a CMakeLists.txt next to its
+        package.xml (see get_package_paths in generate_debian_pkgs.sh).
+        When the repository's tree listing is already in hand the check
+        is a set lookup; otherwise one HEAD request probes the file
+        directly — much cheaper than fetching the directory listing
+        just to scan it for a single name.
+        """
+        cmake_path = f'{package_dir}/CMakeLists.txt' if package_dir \
+            else 'CMakeLists.txt'
+        if tree_paths is not None:
+            return cmake_path in tree_paths
+        try:
+            return self.github_client.file_exists(owner, repo, cmake_path)
+        except Exception as exc:
+            logger.warning('Could not probe %s/%s/%s: %s',
+                           owner, repo, cmake_path, exc)
+            return False
+
+    def analyze_repository(self, owner, repo):
+        """Return the ROS packages contained in a single repository."""
+        packages = []
+        tree_paths = None
+        tree_shas = None
+        try:
+            ref = self.github_client.get_default_branch(owner, repo)
+            tree_data = self.github_client.get_repository_tree(owner, repo,
+                                                               ref)
+            if not tree_data.get('truncated'):
+                tree_paths = set()
+                tree_shas = {}
+                for entry in tree_data.get('tree', []):
+                    if entry.get('type') == 'blob':
+                        tree_paths.add(entry['path'])
+                        tree_shas[entry['path']] = entry.get('sha')
+        except Exception as exc:
+            logger.warning('Could not list tree of %s/%s: %s',
+                           owner, repo, exc)
+        if tree_paths is not None:
+            package_xml_files = sorted(
+                p for p in tree_paths
+                if p == 'package.xml' or p.endswith('/package.xml'))
+        else:
+            # Truncated or unlistable tree: let the client walk it.
+            package_xml_files = self.github_client.find_package_xml_files(
+                owner, repo)
+        logger.info('Found %d package.xml files in %s',
+                    len(package_xml_files), repo)
+        if not package_xml_files:
+            return packages
+        # Passing the blob SHAs lets the client serve files unchanged
+        # since the previous run straight from its on-disk cache.
+        xml_contents = self.github_client.get_file_contents_batch(
+            owner, repo, package_xml_files, shas=tree_shas)
+
+        def _process(package_xml_path):
+            package_dir = package_xml_path.rsplit('/', 1)[0] \
+                if '/' in package_xml_path else ''
+            if not self.validate_ros_package_structure(owner, repo,
+                                                       package_dir,
+                                                       tree_paths):
+                logger.debug('%s/%s is not a catkin package, skipping',
+                             repo, package_dir)
+                return None
+            xml_content = xml_contents.get(package_xml_path)
+            if xml_content is None:
+                logger.warning('Could not fetch %s/%s',
+                               repo, package_xml_path)
+                return None
+            package_name = self.extract_package_name_from_xml(xml_content)
+            if not package_name:
+                return None
+            ros_package = ROSPackage(package_name, repo)
+            logger.info('Found ROS package: %s', ros_package)
+            return ros_package
+
+        # The structure check is one GitHub round-trip per package.xml
+        # and the paths are independent, so fan them out too. Results
+        # are collected as they complete rather than in submission
+        # order, so a slow fetch never holds up parsing the fast ones.
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(_process, path)
+                       for path in package_xml_files]
+            for future in as_completed(futures):
+                ros_package = future.result()
+                if ros_package:
+                    packages.append(ros_package)
+        return packages
+
+    def _scan_one_repo(self, org, repository):
+        repo_name = repository['name']
+        logger.info('Analyzing repository %s/%s', org, repo_name)
+        return self.analyze_repository(org, repo_name)
+
+    def analyze_organization_repositories(self, org='haru-project',
+                                          max_workers=16,
+                                          repositories=None):
+        """Scan every repository of the organization for ROS packages.
+
+        The work is I/O-bound on GitHub round-trips, so repositories are
+        scanned concurrently on a thread pool sharing the client's
+        pooled session; threads release the GIL while waiting on the
+        socket. A pre-filtered repository list can be passed in to skip
+        the listing (see the pushed_at short-circuit in main.py).
+        """
+        packages = []
+        if repositories is None:
+            repositories = self.github_client.iter_organization_repositories(
+                org)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submitting while iterating lets the workers start on the
+            # first listing page while later pages are still in flight.
+            futures = [executor.submit(self._scan_one_repo, org, repository)
+                       for repository in repositories]
+            try:
+                for future in as_completed(futures):
+                    packages.extend(future.result())
+            except RateLimitError:
+                # No point letting the other workers burn what little
+                # quota is left.
+                for future in futures:
+                    future.cancel()
+                raise
+        logger.info('Found %d ROS packages in %s', len(packages), org)
+        return packages
+
+    def get_unique_packages(self, packages):
+        """De-duplicate packages found in several repositories.
+
+        Sorting ascending by (name, repository) and letting the dict
+        keep the last insertion per name preserves the old tie-break
+        (highest repository wins) in a single pass, without per-element
+        branching or lookups.
+        """
+        ordered = sorted(packages,
+                         key=lambda package: (package.name,
+                                              package.repository))
+        unique_packages = {package.name: package for package in ordered}
+        duplicates = len(packages) - len(unique_packages)
+        if duplicates:
+            logger.info('Dropped %d duplicate package entries', duplicates)
+        return list(unique_packages.values())
@@ -0,0 +1,591 @@
+"""Maintenance of the rosdep.yaml database.
+
+Loads the existing rosdep.yaml, merges in the packages found by the
+analyzer and writes the file back. New packages are appended so that
+the hand-written comments in rosdep.yaml are preserved.
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+    _HAVE_LIBYAML = True
+except ImportError:  # pragma: no cover - libyaml bindings are optional
+    from yaml import SafeDumper, SafeLoader
+    _HAVE_LIBYAML = False
+
+logger = logging.getLogger(__name__)
+
+# Scalars that YAML emits unquoted as-is; anything else falls back to
+# the real emitter rather than reimplementing its quoting rules.
+_is_plain_scalar = re.compile(r'[A-Za-z0-9_+.-]+\Z').match
+
+
+class FastROSDumper(SafeDumper):
+    """SafeDumper with exact-type dispatch for the rosdep schema.
+
+    The data this module dumps only ever contains str, list and dict
+    nodes that it built itself, so represent_data can branch on
+    ``type(data) is`` instead of walking the representer registry and
+    the MRO for every node. Anything unexpected falls through to the
+    generic path. The data is tree-shaped, so skipping the anchor
+    bookkeeping for the fast-pathed nodes loses nothing.
+    """
+
+    def represent_data(self, data):
+        data_type = type(data)
+        if data_type is str:
+            return self.represent_str(data)
+        if data_type is list:
+            return self.represent_list(data)
+        if data_type is dict:
+            return self.represent_dict(data)
+        return super().represent_data(data)
+
+
+def _entry_digest(entry):
+    """Stable 128-bit digest of an entry's canonical JSON form.
+
+    Two entries with the same structure hash identically regardless of
+    key insertion order, so unchanged entries can be recognized across
+    runs without keeping the old data in memory.
+    """
+    canonical = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+def _emit_rosdep_entry(name, entry):
+    """Serialize one rosdep entry by hand, or None if it does not fit.
+
+    The appended entries have the rigid shape
+    ``{name: {'ubuntu': {distro: [pkgs]} | [pkgs]}}`` with plain-scalar
+    strings throughout, so string concatenation produces output
+    byte-identical to yaml.dump without representer dispatch or the
+    emitter state machine. Any shape or scalar surprise returns None
+    and the caller uses yaml.dump for that entry.
+    """
+    if not isinstance(entry, dict) or tuple(entry) != ('ubuntu',) \
+            or not _is_plain_scalar(name):
+        return None
+    ubuntu = entry['ubuntu']
+    lines = [name + ':', '  ubuntu:']
+    if isinstance(ubuntu, dict):
+        if not all(isinstance(distro, str) for distro in ubuntu):
+            return None
+        # yaml.dump sorts mapping keys; match it byte for byte.
+        for distro in sorted(ubuntu):
+            pkgs = ubuntu[distro]
+            if not isinstance(pkgs, list) or not _is_plain_scalar(distro):
+                return None
+            lines.append('    ' + distro + ':')
+            for pkg in pkgs:
+                if not isinstance(pkg, str) or not _is_plain_scalar(pkg):
+                    return None
+                lines.append('    - ' + pkg)
+    elif isinstance(ubuntu, list):
+        for pkg in ubuntu:
+            if not isinstance(pkg, str) or not _is_plain_scalar(pkg):
+                return None
+            lines.append('  - ' + pkg)
+    else:
+        return None
+    lines.append('')
+    return '\n'.join(lines)
+
+
+if not _HAVE_LIBYAML:  # pragma: no cover
+    logger.warning('PyYAML was built without libyaml; falling back to the '
+                   'pure-Python loader, which is an order of magnitude '
+                   'slower on large files')
+
+
+class ROSDepUpdater:
+    """Updates rosdep.yaml with packages found in the organization."""
+
+    DIGEST_CACHE_FILE = '.rosdep_cache.json'
+
+    def __init__(self, rosdep_file='rosdep.yaml', keys_only=False):
+        self.rosdep_file = rosdep_file
+        self.rosdep_data = {}
+        self._keys_cache = None
+        self._sorted_keys = []
+        self._added = set()
+        self._loaded = False
+        self._digest_cache = self._load_digest_cache()
+        if keys_only:
+            self.load_rosdep_keys()
+        else:
+            self.load_rosdep_file()
+
+    def _load_digest_cache(self):
+        """Return the {package_name: entry digest} map of previous runs."""
+        try:
+            with open(self.DIGEST_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_digest_cache(self):
+        tmp_file = self.DIGEST_CACHE_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._digest_cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.DIGEST_CACHE_FILE)
+
+    def load_rosdep_file(self):
+        """Load the current rosdep.yaml into memory."""
+        try:
+            # Binary mode: libyaml consumes the UTF-8 bytes directly,
+            # skipping a Python-level decode pass over the whole file.
+            # Large files are memory-mapped so the parser reads straight
+            # from the page cache instead of through buffered read()s.
+            with open(self.rosdep_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size > 1 << 20:
+                    with mmap.mmap(f.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as buf:
+                        self.rosdep_data = yaml.load(
+                            buf, Loader=SafeLoader) or {}
+                else:
+                    self.rosdep_data = yaml.load(f, Loader=SafeLoader) or {}
+            logger.info('Loaded %d entries from %s',
+                        len(self.rosdep_data), self.rosdep_file)
+        except FileNotFoundError:
+            logger.warning('%s not found, starting empty', self.rosdep_file)
+            self.rosdep_data = {}
+        self._keys_cache = None
+        self._sorted_keys = sorted(self.rosdep_data)
+        self._added = set()
+        self._loaded = True
+
+    def load_rosdep_keys(self):
+        """Scan only the top-level keys of rosdep.yaml.
+
+        Filtering against the existing packages needs nothing but the
+        key set, so iterate the parser events and collect the scalars
+        at mapping depth 1 without ever composing the document — a
+        fraction of the work of a full load. The full load is deferred
+        until something actually mutates or saves the data.
+        """
+        keys = set()
+        try:
+            with open(self.rosdep_file, 'rb') as f:
+                depth = 0
+                is_key = True
+                for event in yaml.parse(f, Loader=SafeLoader):
+                    if isinstance(event, yaml.ScalarEvent):
+                        if depth == 1:
+                            if is_key:
+                                keys.add(event.value)
+                            is_key = not is_key
+                    elif isinstance(event, (yaml.MappingStartEvent,
+                                            yaml.SequenceStartEvent)):
+                        if depth == 1:
+                            is_key = not is_key
+                        depth += 1
+                    elif isinstance(event, (yaml.MappingEndEvent,
+                                            yaml.SequenceEndEvent)):
+                        depth -= 1
+                    elif isinstance(event, yaml.AliasEvent):
+                        # An alias is a complete node too; missing this
+                        # would desync the key/value toggle and corrupt
+                        # the key set that drives append-path dedup.
+                        if depth == 1:
+                            is_key = not is_key
+            logger.info('Scanned %d entry names from %s',
+                        len(keys), self.rosdep_file)
+        except FileNotFoundError:
+            logger.warning('%s not found, starting empty', self.rosdep_file)
+        self.rosdep_data = {}
+        self._keys_cache = keys
+        self._sorted_keys = sorted(keys)
+        self._added = set()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Load the full document before its first mutation or save."""
+        if not self._loaded:
+            self.load_rosdep_file()
+
+    def get_existing_packages(self):
+        """Return the names of the packages already in rosdep.yaml.
+
+        The set is built lazily and kept in sync by add_ros_package, so
+        repeated callers (filtering, summaries) do not re-allocate it.
+        """
+        if self._keys_cache is None:
+            self._keys_cache = set(self.rosdep_data)
+        return self._keys_cache
+
+    def filter_new_packages(self, packages):
+        """Return only the packages that are not in rosdep.yaml yet."""
+        existing = self.get_existing_packages()
+        new_packages = [package for package in packages
+                        if package.name not in existing]
+        if (logger.isEnabledFor(logging.DEBUG)
+                and len(new_packages) != len(packages)):
+            skipped = sorted(package.name for package in packages
+                             if package.name in existing)
+            logger.debug('Already in rosdep.yaml, skipped: %s',
+                         ', '.join(skipped))
+        logger.info('%d new packages out of %d found',
+                    len(new_packages), len(packages))
+        return new_packages
+
+    def add_ros_package(self, ros_package, force_update=False):
+        """Add a single package to the database. Returns True if added."""
+        self._ensure_loaded()
+        package_name = ros_package.name
+        is_new = package_name not in self.rosdep_data
+        if not is_new and not force_update:
+            logger.debug('Package %s already exists, skipping', package_name)
+            return False
+        self.rosdep_data[package_name] = ros_package.rosdep_entry
+        if is_new:
+            # O(log n) insertion keeps the key index sorted so saves
+            # never need to re-sort the whole database.
+            bisect.insort(self._sorted_keys, package_name)
+            self._added.add(package_name)
+        if self._keys_cache is not None:
+            self._keys_cache.add(package_name)
+        logger.info('Added %s to rosdep database', package_name)
+        return True
+
+    def add_multiple_packages(self, packages, force_update=False):
+        """Add several packages, returning how many were added.
+
+        Bulk variant of add_ros_package: one membership pass splits the
+        input, the insert happens via a single dict.update, and logging
+        stays at summary level — no per-package call frames or dict
+        re-checks, which matters when the analyzer hands over thousands
+        of mostly-duplicate packages.
+        """
+        existing = self.get_existing_packages()
+        digests = {}
+        if force_update:
+            # A forced run only needs to rewrite entries whose content
+            # actually differs from what the previous run recorded;
+            # the digest cache spots the unchanged ones without loading
+            # the document.
+            new_entries = {}
+            cached = self._digest_cache
+            for package in packages:
+                digest = _entry_digest(package.rosdep_entry)
+                if (package.name not in existing
+                        or cached.get(package.name) != digest):
+                    new_entries[package.name] = package.rosdep_entry
+                    digests[package.name] = digest
+        else:
+            new_entries = {package.name: package.rosdep_entry
+                           for package in packages
+                           if package.name not in existing}
+        if not new_entries:
+            logger.info('No new packages among %d candidates', len(packages))
+            return 0
+        self._ensure_loaded()
+        if force_update:
+            self._digest_cache.update(digests)
+        else:
+            self._digest_cache.update(
+                (name, _entry_digest(entry))
+                for name, entry in new_entries.items())
+        genuinely_new = [name for name in new_entries
+                         if name not in self.rosdep_data]
+        self.rosdep_data.update(new_entries)
+        for name in genuinely_new:
+            bisect.insort(self._sorted_keys, name)
+        self._added.update(genuinely_new)
+        if self._keys_cache is not None:
+            self._keys_cache.update(new_entries)
+        logger.info('Added %d packages (%d skipped)',
+                    len(new_entries), len(packages) - len(new_entries))
+        return len(new_entries)
+
+    @staticmethod
+    def _validate_entry(package_name, package_data):
+        """Return the structural problems of a single rosdep entry."""
+        if not isinstance(package_data, dict):
+            return [f"{package_name}: entry is not a mapping"]
+        if 'ubuntu' not in package_data:
+            return [f"{package_name}: missing ubuntu key"]
+        if not isinstance(package_data['ubuntu'], (dict, list)):
+            return [f"{package_name}: unexpected ubuntu value"]
+        return []
+
+    def validate_yaml_syntax(self, yaml_data):
+        """Check that the data has the expected rosdep structure.
+
+        The data is walked directly — it only ever contains dicts,
+        lists and strings built by this module, so serializing it to
+        YAML and parsing it back (as this used to do) proved nothing
+        the structural walk does not. Serialization errors, were any
+        possible, would surface in save_rosdep_file.
+        """
+        for package_name, package_data in yaml_data.items():
+            issues = self._validate_entry(package_name, package_data)
+            if issues:
+                logger.error('Invalid rosdep entry: %s', issues[0])
+                return False
+        return True
+
+    # Tuple so new prefixes (ros2-, ...) become a one-line change;
+    # str.startswith dispatches the whole tuple in one C call.
+    ROS_PACKAGE_PREFIXES = ('ros-',)
+
+    def validate_existing_entries(self):
+        """Return a list of consistency issues found in the database.
+
+        Only structural problems count as issues. Hand-maintained
+        entries legitimately map to plain system packages (ffmpeg,
+        sox, ...), so names without a ROS prefix are merely noted at
+        debug level rather than reported.
+        """
+        self._ensure_loaded()
+        issues = []
+        unprefixed = []
+        # Locals for everything touched per iteration: global and
+        # attribute lookups add up over a few hundred thousand package
+        # strings.
+        prefixes = self.ROS_PACKAGE_PREFIXES
+        issues_append = issues.append
+        issues_extend = issues.extend
+        _isinstance, _dict, _list, _str = isinstance, dict, list, str
+        validate_entry = self._validate_entry
+        for package_name, package_data in self.rosdep_data.items():
+            entry_issues = validate_entry(package_name, package_data)
+            if entry_issues:
+                issues_extend(entry_issues)
+                continue
+            ubuntu_data = package_data['ubuntu']
+            if _isinstance(ubuntu_data, _dict):
+                distro_lists = ubuntu_data.items()
+            else:
+                distro_lists = ((None, ubuntu_data),)
+            for distro, pkg_list in distro_lists:
+                if not _isinstance(pkg_list, _list):
+                    issues_append(f"{package_name} ({distro}): not a list")
+                    continue
+                # Fast path: the vast majority of entries are clean, so
+                # avoid any message formatting for them.
+                if all(_isinstance(pkg, _str) and pkg.startswith(prefixes)
+                       for pkg in pkg_list):
+                    continue
+                where = f"{package_name} ({distro})" if distro \
+                    else package_name
+                for pkg in pkg_list:
+                    if not _isinstance(pkg, _str):
+                        issues_append(f"{where}: non-string entry {pkg!r}")
+                    elif not pkg.startswith(prefixes):
+                        unprefixed.append(f"{where}: '{pkg}'")
+        if unprefixed and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Entries mapping to non-ROS system packages: %s',
+                         '; '.join(unprefixed))
+        return issues
+
+    def save_rosdep_file(self, backup=True, new_entries=None):
+        """Write the database back to rosdep.yaml.
+
+        When ``new_entries`` is given only those entries are appended to
+        the file, preserving the hand-written comments; otherwise the
+        whole file is rewritten sorted by package name.
+        """
+        self._ensure_loaded()
+        if backup:
+            backup_file = self.rosdep_file + '.bak'
+            try:
+                # Keep one generation of history: the old backup moves
+                # aside (a rename, no bytes copied) rather than being
+                # deleted, so even a save-gone-wrong-twice leaves a
+                # recoverable copy.
+                os.replace(backup_file, backup_file + '.prev')
+            except FileNotFoundError:
+                pass
+            try:
+                if new_entries:
+                    # The append branch writes through the live inode,
+                    # which a hardlinked backup would share — it would
+                    # mutate right along with the file. Copy the bytes.
+                    shutil.copy2(self.rosdep_file, backup_file)
+                else:
+                    # The rewrite branch publishes via os.replace, which
+                    # unlinks only our name, so a hardlink preserves the
+                    # old bytes without copying them.
+                    os.link(self.rosdep_file, backup_file)
+                logger.debug('Backed up %s to %s',
+                             self.rosdep_file, backup_file)
+            except FileNotFoundError:
+                pass  # first run, nothing to back up yet
+            except OSError:
+                shutil.copy2(self.rosdep_file, backup_file)
+                logger.debug('Backed up %s to %s',
+                             self.rosdep_file, backup_file)
+        if new_entries:
+            parts = []
+            for entry_name, entry in sorted(new_entries.items()):
+                part = _emit_rosdep_entry(entry_name, entry)
+                if part is None:
+                    part = yaml.dump({entry_name: entry},
+                                     Dumper=FastROSDumper,
+                                     default_flow_style=False, indent=2,
+                                     allow_unicode=True)
+                parts.append(part)
+            text = ''.join(parts)
+            # One open serves both the trailing-newline probe and the
+            # append, instead of a stat + exists check + two opens.
+            data = text.encode('utf-8')
+            try:
+                with open(self.rosdep_file, 'r+b') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size > 0:
+                        f.seek(size - 1)
+                        if f.read(1) != b'\n':
+                            f.write(b'\n')
+                    else:
+                        f.seek(0, os.SEEK_END)
+                    f.write(data)
+            except FileNotFoundError:
+                with open(self.rosdep_file, 'wb') as f:
+                    f.write(data)
+            logger.info('Appended %d entries to %s',
+                        len(new_entries), self.rosdep_file)
+        else:
+            directory = os.path.dirname(
+                os.path.abspath(self.rosdep_file)) or '.'
+            try:
+                mode = os.stat(self.rosdep_file).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            tf = tempfile.NamedTemporaryFile('w', dir=directory,
+                                             delete=False, encoding='utf-8',
+                                             prefix='.rosdep_',
+                                             suffix='.tmp')
+            try:
+                with tf:
+                    # One dump call per top-level entry streams the
+                    # document out with a single entry's emit buffer
+                    # live at a time, instead of materializing the
+                    # whole sorted dict and its serialization at once.
+                    rosdep_data = self.rosdep_data
+                    for key in self._sorted_keys:
+                        yaml.dump({key: rosdep_data[key]}, tf,
+                                  Dumper=FastROSDumper,
+                                  default_flow_style=False, indent=2,
+                                  width=120, allow_unicode=True,
+                                  sort_keys=False)
+                    tf.flush()
+                    os.fsync(tf.fileno())
+                # NamedTemporaryFile creates 0600; restore the published
+                # file's mode before it takes over the name.
+                os.chmod(tf.name, mode)
+                # Atomic on POSIX: readers see either the old file or
+                # the complete new one, never a partial write.
+                os.replace(tf.name, self.rosdep_file)
+            except BaseException:
+                try:
+                    os.unlink(tf.name)
+                except OSError:
+                    pass
+                raise
+            logger.info('Wrote %d entries to %s',
+                        len(self._sorted_keys), self.rosdep_file)
+        # The save succeeded; publish the digests so the next run can
+        # recognize these entries as already written.
+        self._save_digest_cache()
+
+    def get_manual_packages(self, manual_file='manual_entries.txt'):
+        """Return the packages that are maintained by hand.
+
+        These must never be overwritten by the automatic update. The
+        list comes from manual_entries.txt plus the MANUAL_PACKAGES
+        environment variable (comma or space separated).
+        """
+        try:
+            with open(manual_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = ''
+        manual_packages = {stripped for stripped in
+                           (line.strip() for line in text.splitlines())
+                           if stripped and stripped[0] != '#'}
+        env_value = os.environ.get('MANUAL_PACKAGES', '')
+        if env_value:
+            manual_packages.update(
+                name for name in re.split(r'[\s,]+', env_value) if name)
+        return manual_packages
+
+    def get_changes_summary(self, original_packages=None):
+        """Summarize what changed since load.
+
+        The updater only ever adds entries, so the names recorded by
+        add_ros_package are the whole diff and no set arithmetic over
+        the full keyspace is needed. Passing an explicit key snapshot
+        keeps the old comparison behaviour for callers that mutate the
+        data in other ways.
+        """
+        if original_packages is None:
+            added_packages = self._added
+            removed_packages = ()
+            total = len(self.get_existing_packages())
+        else:
+            current_packages = self.get_existing_packages()
+            added_packages = current_packages - original_packages
+            removed_packages = original_packages - current_packages
+            total = len(current_packages)
+        return {
+            'added_packages': sorted(added_packages),
+            'removed_packages': sorted(removed_packages),
+            'added_count': len(added_packages),
+            'removed_count': len(removed_packages),
+            'total_packages': total,
+        }
+
+
+def update_rosdep_with_packages(packages, rosdep_file='rosdep.yaml',
+                                force_update=False, backup=True):
+    """Merge the given packages into rosdep.yaml and save it."""
+    # Keys-only: when the scan turns up nothing new (the common case
+    # for a nightly run), the full document is never parsed.
+    updater = ROSDepUpdater(rosdep_file, keys_only=True)
+    # One pass applies both filters: already-known packages (unless
+    # forcing) and manually maintained ones.
+    existing = updater.get_existing_packages()
+    manual_packages = updater.get_manual_packages()
+    packages_to_add = [package for package in packages
+                       if (force_update or package.name not in existing)
+                       and package.name not in manual_packages]
+    skipped_manual = sorted(package.name for package in packages
+                            if package.name in manual_packages)
+    if skipped_manual:
+        logger.info('Skipping manually maintained packages: %s',
+                    ', '.join(skipped_manual))
+    logger.info('%d of %d packages selected for update',
+                len(packages_to_add), len(packages))
+    added = updater.add_multiple_packages(packages_to_add,
+                                          force_update=force_update)
+    issues = []
+    if added:
+        if not updater.validate_yaml_syntax(updater.rosdep_data):
+            logger.error('Aborting save: rosdep data failed validation')
+            return {'success': False}
+        issues = updater.validate_existing_entries()
+        for issue in issues:
+            logger.warning('rosdep.yaml issue: %s', issue)
+        if force_update:
+            updater.save_rosdep_file(backup=backup)
+        else:
+            new_entries = {p.name: updater.rosdep_data[p.name]
+                           for p in packages_to_add
+                           if p.name in updater.rosdep_data}
+            updater.save_rosdep_file(backup=backup, new_entries=new_entries)
+    result = {'success': True, 'validation_issues': issues}
+    result.update(updater.get_changes_summary())
+    return result